@@ -1,31 +1,411 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pa_parquet
 from datetime import datetime, date, time, timedelta
+from pathlib import Path
+import hashlib
 import io
+import tempfile
+import xlsxwriter
+
+# When enabled in the sidebar, read Order-list files are kept here as Parquet, keyed by a hash of the uploaded bytes.
+# The directory is private to the user running the app, and old or excess files are evicted after each write
+ORDER_LIST_CACHE_DIR = Path.home() / ".cache" / "revenue_recon" / "order_lists"
+ORDER_LIST_CACHE_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+ORDER_LIST_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Part of the cache key; bump whenever Order-list reading changes so older Parquet copies are never served
+ORDER_LIST_CACHE_VERSION = 2
+# Order-list columns each tab actually uses; everything else is dropped right after load
+ORDER_LIST_COLUMNS = ("Transaction ID", "Plan Type", "Grand Total", "Gateway", "Updated At")
+COINS_ORDER_LIST_COLUMNS = ("Tracking ID", "Plan Type", "Grand Total", "Updated At")
+# Parsed uploads each loader keeps in server memory (shared by all sessions); older or excess entries are evicted
+UPLOAD_CACHE_MAX_ENTRIES = 16
+UPLOAD_CACHE_TTL_SECONDS = 60 * 60
+# Rows converted to Python objects at a time when streaming a sheet to Excel
+EXCEL_WRITE_CHUNK_ROWS = 10_000
+# Leading rows measured when sizing a report column; widths don't need to be exact to the last row
+EXCEL_WIDTH_SAMPLE_ROWS = 2_000
+# Finished workbooks larger than this are spooled to a temp file while being zipped, instead of a growing buffer
+EXCEL_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+# Filtered slices are only copied when written to; always on from pandas 3, where the option is deprecated
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+def parse_datetime_columns(df, parse_dates_cols):
+    """Parse the given columns (those present) to naive datetimes in place; offsets are dropped and the wall-clock time kept"""
+    for col in parse_dates_cols or ():
+        if col not in df.columns:
+            continue
+        parsed = pd.to_datetime(df[col], cache=True)
+        df[col] = parsed.dt.tz_localize(None) if parsed.dt.tz is not None else parsed
+    return df
+
+def arrow_row_filter(row_filter):
+    """pyarrow expression keeping rows where every (column, value) pair matches case-insensitively"""
+    conditions = [pc.utf8_lower(pc.field(col)) == value.lower() for col, value in row_filter]
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
 
 # Performance optimization
-@st.cache_data
-def load_csv_file(file_content, parse_dates_cols):
+@st.cache_data(max_entries=UPLOAD_CACHE_MAX_ENTRIES, ttl=UPLOAD_CACHE_TTL_SECONDS)
+def load_csv_file(file_content, parse_dates_cols=None, row_filter=None):
     """Cache CSV loading for better performance"""
-    return pd.read_csv(io.BytesIO(file_content), parse_dates=parse_dates_cols)
-
-@st.cache_data
-def load_excel_file(file_content, parse_dates_cols):
+    try:
+        # pyarrow's multi-threaded parser; it infers types per block, so fall back if a later row doesn't fit.
+        # Date columns are read as text: pyarrow would shift offset timestamps to UTC before
+        # parse_datetime_columns could keep their local clock time
+        table = pa_csv.read_csv(
+            io.BytesIO(file_content),
+            convert_options=pa_csv.ConvertOptions(
+                strings_can_be_null=True,
+                column_types={col: pa.string() for col in parse_dates_cols or ()}
+            )
+        )
+        if row_filter:
+            # Drop non-matching rows inside pyarrow so they never become pandas objects
+            table = table.filter(arrow_row_filter(row_filter))
+        df = table.to_pandas()
+    except (pd.errors.ParserError, pa.ArrowException):
+        # Unfiltered fallback; callers still apply the same filter in pandas
+        df = pd.read_csv(io.BytesIO(file_content))
+    return parse_datetime_columns(df, parse_dates_cols)
+
+@st.cache_data(max_entries=UPLOAD_CACHE_MAX_ENTRIES, ttl=UPLOAD_CACHE_TTL_SECONDS)
+def load_excel_file(file_content, parse_dates_cols=None):
     """Cache Excel loading for better performance"""
-    return pd.read_excel(io.BytesIO(file_content), parse_dates=parse_dates_cols)
+    return parse_datetime_columns(pd.read_excel(io.BytesIO(file_content), engine="calamine"), parse_dates_cols)
+
+@st.cache_data(max_entries=UPLOAD_CACHE_MAX_ENTRIES, ttl=UPLOAD_CACHE_TTL_SECONDS)
+def load_csv_column(file_content, column):
+    """Cache reading a single CSV column (an empty frame when the file lacks it), without parsing the rest of the file"""
+    try:
+        return pa_csv.read_csv(
+            io.BytesIO(file_content),
+            convert_options=pa_csv.ConvertOptions(include_columns=[column], strings_can_be_null=True)
+        ).to_pandas()
+    except pa.ArrowException:
+        # Missing column or a block pyarrow can't type; the pandas reader handles both
+        return pd.read_csv(io.BytesIO(file_content), usecols=lambda col: col == column)
+
+def uploaded_column_values(uploaded_file, column):
+    """Distinct values of one column of an uploaded file, taken before any reader-side row filter"""
+    if uploaded_file.name.lower().endswith(('.csv', '.txt')):
+        df = load_csv_column(uploaded_file.getvalue(), column)
+    else:
+        df = load_excel_file(uploaded_file.getvalue())
+    return set(df[column].unique()) if column in df.columns else set()
+
+def load_uploaded_file(uploaded_file, parse_dates_cols=None, row_filter=None):
+    """Load an uploaded CSV/TXT or Excel file through the cached loaders (keyed on the file bytes); row_filter is applied only on the CSV path"""
+    if uploaded_file.name.lower().endswith(('.csv', '.txt')):
+        return load_csv_file(uploaded_file.getvalue(), parse_dates_cols, row_filter)
+    return load_excel_file(uploaded_file.getvalue(), parse_dates_cols)
+
+def finish_order_list(df):
+    """Post-read step shared by fresh parses and Parquet hits: parse Updated At and pin its unit (Parquet has no seconds unit)"""
+    parse_datetime_columns(df, ["Updated At"])
+    if "Updated At" in df.columns:
+        df["Updated At"] = df["Updated At"].astype("datetime64[ns]")
+    return df
+
+def prune_order_list_cache():
+    """Drop persisted Order-lists older than the age limit, then the oldest ones until the directory fits the size cap"""
+    now = datetime.now().timestamp()
+    entries = []
+    for path in ORDER_LIST_CACHE_DIR.glob("*.parquet"):
+        stat = path.stat()
+        if now - stat.st_mtime > ORDER_LIST_CACHE_MAX_AGE_SECONDS:
+            path.unlink(missing_ok=True)
+        else:
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= ORDER_LIST_CACHE_MAX_BYTES:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+@st.cache_data(max_entries=UPLOAD_CACHE_MAX_ENTRIES, ttl=UPLOAD_CACHE_TTL_SECONDS)
+def load_order_list_file(file_content, file_name, columns, persist=False):
+    """Cache Order-list loading of the requested columns; with persist, reuse or save a Parquet copy of the read file"""
+    digest = hashlib.blake2b(file_content, digest_size=16).hexdigest()
+    cache_path = ORDER_LIST_CACHE_DIR / f"{digest}-v{ORDER_LIST_CACHE_VERSION}.parquet"
+    if persist and cache_path.exists():
+        try:
+            available = pa_parquet.read_schema(cache_path).names
+            df = pd.read_parquet(cache_path, engine="pyarrow", columns=[col for col in columns if col in available])
+            return finish_order_list(df)
+        except (OSError, ValueError, pa.ArrowException):
+            # Pruned by another session since exists(), or unreadable; parse the upload instead
+            pass
+    if file_name.lower().endswith('.csv'):
+        try:
+            # pyarrow's multi-threaded reader; empty strings become nulls to match pd.read_csv.
+            # Updated At stays text so an offset isn't shifted to UTC before finish_order_list drops it
+            df = pa_csv.read_csv(
+                io.BytesIO(file_content),
+                convert_options=pa_csv.ConvertOptions(strings_can_be_null=True, column_types={"Updated At": pa.string()})
+            ).to_pandas()
+        except pa.ArrowInvalid:
+            # pyarrow infers types from the first block; fall back if a later row doesn't fit
+            df = pd.read_csv(io.BytesIO(file_content))
+    else:
+        df = pd.read_excel(io.BytesIO(file_content), engine="calamine")
+    if persist:
+        # The file is stored as read; hits go through the same finish_order_list step as a fresh parse
+        try:
+            ORDER_LIST_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+            ORDER_LIST_CACHE_DIR.chmod(0o700)
+            tmp_path = cache_path.with_suffix(".tmp")
+            df.to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+            tmp_path.chmod(0o600)
+            tmp_path.replace(cache_path)
+            prune_order_list_cache()
+        except (OSError, ValueError, pa.ArrowException):
+            # Persisting is best-effort: mixed-type columns can't be stored as Parquet
+            pass
+    return finish_order_list(df[[col for col in columns if col in df.columns]])
 
 st.set_page_config(page_title="Payment Gateway Comparator", layout="wide")
 st.title("ZEN vs BridgerPay vs Coins Buy vs PayProcc Comparator")
+st.sidebar.checkbox(
+    "Keep read Order-list files on this server",
+    value=False,
+    key="persist_order_lists",
+    help="Saves a private Parquet copy of each uploaded Order-list so re-uploading the same file skips parsing. Copies expire after 7 days."
+)
 
 # Create five tabs: ZEN, BridgerPay, Coins Buy, PayProcc, and Summary
 tab_zen, tab_bp, tab_coins, tab_payprocc, tab_summary = st.tabs(["ZEN", "BridgerPay", "Coins Buy", "PayProcc", "Summary"])
 
 # Futures filtering function - checks if "Futures" is in the Plan Type name
-def is_futures_plan(plan_type):
-    """Check if a plan type contains 'Futures' (case-insensitive)"""
-    if pd.isna(plan_type):
-        return False
-    return "futures" in str(plan_type).lower()
+def is_futures_plan(plan_types):
+    """Boolean mask of plan types (or PayProcc descriptions) containing 'Futures' (case-insensitive); missing values count as CFD"""
+    # Plan names repeat heavily, so test each distinct name once; missing plans (code -1) pick the trailing False
+    codes, uniques = pd.factorize(plan_types)
+    is_futures = np.append(pd.Index(uniques).astype(str).str.contains("futures", case=False, regex=False), False)
+    return pd.Series(is_futures[codes], index=plan_types.index)
+
+def category_matches(values, target):
+    """Case-insensitive equality on a categorical column, evaluated once per category instead of once per row"""
+    categories = values.cat.categories
+    return values.isin(categories[categories.astype(str).str.lower() == target.lower()])
+
+def gmt6_day(timestamps):
+    """Calendar day of each timestamp shifted to GMT+6, as datetime64[D] rather than Python date objects"""
+    return (timestamps.to_numpy(dtype="datetime64[ns]") + np.timedelta64(6, "h")).astype("datetime64[D]")
+
+def excel_column_width(values, header):
+    """Column width for a report sheet: the longest rendered value (of the leading rows) or header, plus padding"""
+    # Numbers and timestamps render at a near-fixed width, so only text columns get converted and measured
+    if pd.api.types.is_numeric_dtype(values):
+        longest = 12
+    elif pd.api.types.is_datetime64_any_dtype(values):
+        longest = len("yyyy-mm-dd hh:mm:ss")
+    else:
+        longest = values.head(EXCEL_WIDTH_SAMPLE_ROWS).astype("string").str.len().max()
+    return max(0 if pd.isna(longest) else int(longest), len(str(header))) + 2
+
+def excel_column_format(values, formats):
+    """Number format for a report column: datetimes and dates need one, everything else is written as-is"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        # Day columns (datetime64[D] Date from gmt6_day or the PayProcc day cast) hold only midnights;
+        # format them like the date objects they replaced
+        stamps = values.dropna()
+        return formats["date"] if len(stamps) and (stamps == stamps.dt.normalize()).all() else formats["datetime"]
+    first = values.dropna().head(1)
+    if len(first) and isinstance(first.iloc[0], date):
+        return formats["datetime"] if isinstance(first.iloc[0], datetime) else formats["date"]
+    return None
+
+def write_excel_report(sheets, output):
+    """Stream each sheet into an xlsx workbook in constant-memory mode.
+
+    Sheets map a name to a DataFrame, or to a (DataFrame, columns) pair to write only those columns in that order
+    """
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True, "strings_to_urls": False, "tmpdir": tempfile.gettempdir()})
+    formats = {
+        "header": workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"}),
+        "datetime": workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"}),
+        "date": workbook.add_format({"num_format": "yyyy-mm-dd"}),
+    }
+    for sheet_name, sheet in sheets.items():
+        df_out, columns = sheet if isinstance(sheet, tuple) else (sheet, sheet.columns)
+        # Select columns per chunk rather than copying the whole frame up front
+        positions = df_out.columns.get_indexer(columns)
+        ws = workbook.add_worksheet(sheet_name)
+        # Rows are flushed to disk as soon as they're complete, so widths and formats must be set first
+        for idx, col in enumerate(columns):
+            ws.set_column(idx, idx, excel_column_width(df_out[col], col), excel_column_format(df_out[col], formats))
+        ws.write_row(0, 0, [str(col) for col in columns], formats["header"])
+        for start in range(0, len(df_out), EXCEL_WRITE_CHUNK_ROWS):
+            chunk = df_out.iloc[start:start + EXCEL_WRITE_CHUNK_ROWS, positions].astype(object)
+            # Blank out NaN/NaT/NA; xlsxwriter rejects them as numbers or dates
+            chunk = chunk.where(chunk.notna(), None)
+            for row_num, row in enumerate(chunk.itertuples(index=False, name=None), start=start + 1):
+                ws.write_row(row_num, 0, row)
+    workbook.close()
+
+# --- Shared reconciliation steps (ZEN, BridgerPay and Coins Buy tabs) ---
+def as_categories(df, columns):
+    """Convert the listed low-cardinality columns (those present) to categoricals so filters compare codes, not strings"""
+    for col in columns:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+def require_columns(df, required_cols, file_label):
+    """Stop with an error listing any required columns the uploaded file lacks"""
+    missing_cols = [col for col in required_cols if col not in df.columns]
+    if missing_cols:
+        st.error(f"{file_label} file must contain these columns: {', '.join(missing_cols)}. Found columns: {list(df.columns)}")
+        st.stop()
+
+def gateway_values(df):
+    """Distinct Gateway values of a frame (empty when the column is absent)"""
+    return set(df["Gateway"].unique()) if "Gateway" in df.columns else set()
+
+def require_gateway(gateways, gateway, message):
+    """Stop with an error unless every distinct Gateway value is gateway; a blank value in the column is a mismatch, a file without the column passes"""
+    if not gateways <= {gateway}:
+        st.error(message)
+        st.stop()
+
+def select_date_range(timestamps, key_prefix=None):
+    """Start/end date pickers defaulting to the span of the given timestamps"""
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("Start date", value=timestamps.dt.date.min(), key=key_prefix and f"{key_prefix}_start_date")
+    with col2:
+        end_date = st.date_input("End date", value=timestamps.dt.date.max(), key=key_prefix and f"{key_prefix}_end_date")
+    return start_date, end_date
+
+@st.cache_data(show_spinner=False, max_entries=4, ttl=UPLOAD_CACHE_TTL_SECONDS)
+def combine_order_lists(files_content, file_names, columns, dedupe_key=None, persist=False):
+    """Cache the concat (plus optional first-per-key dedupe and Updated At sort) of Order-list files, with the stats the tabs report"""
+    order_list_dfs = [load_order_list_file(content, name, columns, persist) for content, name in zip(files_content, file_names)]
+    # A single upload is used as-is rather than copied by concat
+    df_ord = order_list_dfs[0] if len(order_list_dfs) == 1 else pd.concat(order_list_dfs, ignore_index=True)
+    stats = {
+        "file_counts": [len(df_temp) for df_temp in order_list_dfs],
+        "combined_count": len(df_ord),
+        "gateways": gateway_values(df_ord),
+    }
+    if dedupe_key is not None:
+        df_ord = df_ord.drop_duplicates(subset=[dedupe_key], keep="first").sort_values("Updated At")
+    stats["removed"] = stats["combined_count"] - len(df_ord)
+    return df_ord, stats
+
+def load_order_lists(order_files, columns, dedupe_key=None):
+    """Load and combine the uploaded Order-list files, reporting per-file and combined entry counts"""
+    df_ord, stats = combine_order_lists(
+        tuple(order_file.getvalue() for order_file in order_files),
+        tuple(order_file.name for order_file in order_files),
+        columns,
+        dedupe_key,
+        st.session_state.get("persist_order_lists", False)
+    )
+    for i, (order_file, count) in enumerate(zip(order_files, stats["file_counts"])):
+        st.info(f"File {i+1} ({order_file.name}): {count} entries")
+    st.info(f"Combined Order List: {stats['combined_count']} total entries before cleaning")
+    return df_ord, stats
+
+def drop_duplicate_keys(df, key, warning):
+    """Keep the first row per key; warning is formatted with {removed} and {initial} when rows are dropped"""
+    initial = len(df)
+    df = df.drop_duplicates(subset=[key], keep="first")
+    removed = initial - len(df)
+    if removed:
+        st.warning(warning.format(removed=removed, initial=initial))
+    return df
+
+def merge_order_list(df_psp, df_ord, psp_key, ord_key):
+    """Left-merge Plan Type and Grand Total from the Order-list onto PSP rows; also returns the unmatched-PSP mask"""
+    df_ord_sel = df_ord[[ord_key, "Plan Type", "Grand Total"]].set_index(ord_key)
+    # Order-list keys are deduped upstream, so validate the many-to-one shape and skip sorting the join keys
+    df_merged = df_psp.merge(df_ord_sel, left_on=psp_key, right_index=True, how="left", indicator=True, sort=False, validate="m:1")
+    return df_merged, df_merged.pop("_merge") == "left_only"
+
+def show_amount_mismatches(df_merged, unmatched_mask, amount_col, display_cols, gateway_label):
+    """Report matched rows whose PSP amount differs from the Order-list Grand Total"""
+    mask_amt = ~unmatched_mask & (df_merged[amount_col] != df_merged["Grand Total"])
+    if mask_amt.any():
+        st.warning(f"Found {mask_amt.sum()} amount mismatches in {gateway_label}:")
+        # Only slice and ship the rows to the browser when the user asks to see them
+        if st.checkbox("Show mismatches", key=f"{gateway_label}_show_mismatches"):
+            st.dataframe(df_merged.loc[mask_amt, display_cols])
+    else:
+        st.success("No amount mismatches")
+
+def book_unmatched_as_cfd(df_merged, unmatched_mask, amount_col, display_cols, gateway_label):
+    """Report unmatched PSP rows and book them as CFD at their PSP amount (in place)"""
+    if unmatched_mask.any():
+        st.warning(f"Found {unmatched_mask.sum()} unmatched {gateway_label} PSP entries - adding to CFD:")
+        if st.checkbox("Show unmatched entries", key=f"{gateway_label}_show_unmatched"):
+            st.dataframe(df_merged.loc[unmatched_mask, display_cols])
+        df_merged.loc[unmatched_mask, "Plan Type"] = "CFD (Unmatched PSP)"
+        df_merged.loc[unmatched_mask, "Grand Total"] = df_merged.loc[unmatched_mask, amount_col]
+
+def summarize_and_split(df_merged, date_col, amount_col):
+    """Datewise GMT+6 revenue summary from one groupby, plus the Futures and CFD rows"""
+    futures_mask = is_futures_plan(df_merged["Plan Type"])
+    df_merged["Date"] = gmt6_day(df_merged[date_col])
+    df_merged["Category"] = np.where(futures_mask, "Futures", "CFD")
+    df_summary = df_merged.groupby(["Date", "Category"], as_index=False).agg(Revenue=(amount_col, "sum"))
+    df_summary["Date"] = df_summary["Date"].dt.date
+    return df_summary, df_merged[futures_mask], df_merged[~futures_mask]
+
+def report_digest(sheets):
+    """Digest of every written cell, dtype and header of the report sheets (Streamlit only samples large frames when hashing)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for sheet_name, sheet in sheets.items():
+        df_out, columns = sheet if isinstance(sheet, tuple) else (sheet, sheet.columns)
+        digest.update(repr((sheet_name, len(df_out))).encode())
+        for col in columns:
+            digest.update(repr((col, str(df_out[col].dtype))).encode())
+            digest.update(pd.util.hash_pandas_object(df_out[col], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_excel_report(_sheets, sheets_digest):
+    """xlsx report bytes for the given sheets (as accepted by write_excel_report); cached on their report_digest only"""
+    with tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_MAX_BYTES) as output:
+        write_excel_report(_sheets, output)
+        output.seek(0)
+        return output.read()
+
+def offer_report_download(sheets, label, file_name):
+    """Build the xlsx report (sheets as accepted by write_excel_report) and show its download button"""
+    st.download_button(
+        label=label,
+        data=build_excel_report(sheets, report_digest(sheets)),
+        file_name=file_name,
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def combine_gateway_summaries(summaries):
+    """Combined Date/Category/Gateway revenue, its pivot view, and the per-gateway and per-category totals"""
+    df_combined = pd.concat(summaries, ignore_index=True)
+    # Group by Date, Category, and Gateway; sorted output is kept, since every result here is shown or exported in order
+    df_combined_grouped = df_combined.groupby(["Date", "Category", "Gateway"], as_index=False, observed=True).agg(Revenue=("Revenue", "sum"))
+    # Pivot for better visualization; keys are already unique, so a plain reshape with no re-aggregation
+    df_pivot = (
+        df_combined_grouped.set_index(["Date", "Category", "Gateway"])["Revenue"]
+        .unstack(["Category", "Gateway"], fill_value=0)
+        .sort_index(axis=1)
+        .reset_index()
+    )
+    df_gateway_totals = df_combined_grouped.groupby("Gateway", as_index=False, observed=True).agg(Total=("Revenue", "sum"))
+    df_category_totals = df_combined_grouped.groupby("Category", as_index=False, observed=True).agg(Total=("Revenue", "sum"))
+    return df_combined_grouped, df_pivot, df_gateway_totals, df_category_totals
 
 # --- ZEN Tab ---
 with tab_zen:
@@ -36,59 +416,26 @@ with tab_zen:
     if zen_file and order_files_zen:
         # Load ZEN with caching
         with st.spinner("Loading ZEN file..."):
-            if zen_file.name.lower().endswith('.csv'):
-                df_zen = load_csv_file(zen_file.read(), ["accepted_at"])
-            else:
-                df_zen = load_excel_file(zen_file.read(), ["accepted_at"])
-            df_zen["accepted_at"] = df_zen["accepted_at"].dt.tz_localize(None)
+            df_zen = load_uploaded_file(zen_file, ["accepted_at"])
+            require_columns(df_zen, ["merchant_transaction_id", "accepted_at", "payment_channel", "transaction_type", "transaction_currency", "transaction_amount"], "ZEN")
+            as_categories(df_zen, ("Gateway", "payment_channel", "transaction_type", "transaction_currency"))
 
         # Validate gateway columns
-        if not (df_zen.get("Gateway", pd.Series()).eq("Zen Pay").all()):
-            st.error("ZEN file must have Gateway='Zen Pay'")
-            st.stop()
+        require_gateway(gateway_values(df_zen), "Zen Pay", "ZEN file must have Gateway='Zen Pay'")
 
         # Load and merge multiple Order-list files for ZEN
         st.subheader("Step 2: Process ZEN Order List Files")
         st.info(f"Processing {len(order_files_zen)} Order List file(s)")
+        df_ord, ord_stats = load_order_lists(order_files_zen, ORDER_LIST_COLUMNS, "Transaction ID")
+        require_gateway(ord_stats["gateways"], "Zen Pay", "Order-list must have Gateway='Zen Pay'")
         
-        # Load all Order List files
-        order_list_dfs = []
-        for i, order_file in enumerate(order_files_zen):
-            if order_file.name.lower().endswith('.csv'):
-                df_temp = pd.read_csv(order_file, parse_dates=["Updated At"])
-            else:
-                df_temp = pd.read_excel(order_file, parse_dates=["Updated At"])
-            st.info(f"File {i+1} ({order_file.name}): {len(df_temp)} entries")
-            order_list_dfs.append(df_temp)
-        
-        # Merge all Order List files
-        df_ord = pd.concat(order_list_dfs, ignore_index=True)
-        st.info(f"Combined Order List: {len(df_ord)} total entries before cleaning")
-        
-        if not all(g == "Zen Pay" for g in df_ord.get("Gateway", pd.Series()).unique()):
-            st.error("Order-list must have Gateway='Zen Pay'")
-            st.stop()
-        df_ord = df_ord[df_ord.get("Gateway", "") == "Zen Pay"].copy()
-        
-        # Clean merged Order List: Remove duplicates and sort by datetime
-        duplicates_ord = df_ord.duplicated(subset=["Transaction ID"], keep=False)
-        if duplicates_ord.any():
-            st.warning(f"Removed {duplicates_ord.sum()} duplicates from merged Order List")
-            df_ord = df_ord.drop_duplicates(subset=["Transaction ID"], keep="first")
-        
-        # Sort by Updated At datetime
-        df_ord = df_ord.sort_values("Updated At")
-        
+        # Merged Order List was cleaned (duplicates removed, sorted by datetime) by the cached loader
+        if ord_stats["removed"]:
+            st.warning(f"Removed {ord_stats['removed']} duplicates from merged Order List")
         st.success(f"Final merged Order List: {len(df_ord)} clean entries (sorted by datetime)")
 
         # Date range selection based on ZEN data
-        min_date = df_zen['accepted_at'].dt.date.min()
-        max_date = df_zen['accepted_at'].dt.date.max()
-        col1, col2 = st.columns(2)
-        with col1:
-            start_date = st.date_input("Start date", value=min_date)
-        with col2:
-            end_date = st.date_input("End date", value=max_date)
+        start_date, end_date = select_date_range(df_zen["accepted_at"])
 
         # Define head/tail windows (GMT+2 offset for Order List)
         start_zen = datetime.combine(start_date, time(18, 0, 0))
@@ -96,113 +443,59 @@ with tab_zen:
         start_ord = datetime.combine(start_date, time(20, 0, 0))
         end_ord = datetime.combine(end_date, time(19, 59, 59))
 
-        # Filter ZEN
-        df_zen_filt = df_zen[
+        # Filter ZEN and non-USD with one combined mask
+        mask_zen = (
             (df_zen["accepted_at"] >= start_zen) &
             (df_zen["accepted_at"] <= end_zen) &
-            (df_zen["payment_channel"].str.lower() != "card") &
-            (df_zen["transaction_type"].str.lower() == "purchase")
-        ].copy()
-
-        # Filter non-USD and duplicates
-        mask_currency_zen = df_zen_filt["transaction_currency"].str.upper() != "USD"
-        if mask_currency_zen.any():
-            st.warning(f"Excluded {mask_currency_zen.sum()} non-USD transactions")
-            df_zen_filt = df_zen_filt.loc[~mask_currency_zen]
-
-        initial_zen_count = len(df_zen_filt)
-        duplicates_zen = df_zen_filt.duplicated(subset=["merchant_transaction_id"], keep=False)
-        if duplicates_zen.any():
-            st.warning(f"Removed {duplicates_zen.sum()} duplicates from {initial_zen_count} ZEN transactions")
-            df_zen_filt = df_zen_filt.drop_duplicates(subset=["merchant_transaction_id"], keep="first")
+            ~category_matches(df_zen["payment_channel"], "card") &
+            category_matches(df_zen["transaction_type"], "purchase")
+        )
+        mask_usd_zen = category_matches(df_zen["transaction_currency"], "USD")
+        excluded_currency_zen = (mask_zen & ~mask_usd_zen).sum()
+        if excluded_currency_zen:
+            st.warning(f"Excluded {excluded_currency_zen} non-USD transactions")
+        df_zen_filt = df_zen[mask_zen & mask_usd_zen]
+
+        # Filter duplicates
+        df_zen_filt = drop_duplicate_keys(df_zen_filt, "merchant_transaction_id", "Removed {removed} duplicates from {initial} ZEN transactions")
         st.info(f"ZEN PSP: {len(df_zen_filt)} clean transactions")
 
-        # Clean Order List
-        initial_ord_count = len(df_ord)
-        duplicates_ord = df_ord.duplicated(subset=["Transaction ID"], keep=False)
-        if duplicates_ord.any():
-            st.warning(f"Removed {duplicates_ord.sum()} duplicates from Order List")
-            df_ord = df_ord.drop_duplicates(subset=["Transaction ID"], keep="first")
+        # Order List was already deduplicated on Transaction ID when the files were combined
         st.info(f"Order List: {len(df_ord)} clean entries")
 
-        # Filter Order-list and select needed columns
-        df_ord_filt = df_ord[
-            (df_ord["Updated At"] >= start_ord) &
-            (df_ord["Updated At"] <= end_ord)
-        ][["Transaction ID", "Plan Type", "Grand Total"]].copy()
-
-        # Merge on transaction ID
-        df_merged = df_zen_filt.merge(
-            df_ord_filt,
-            left_on="merchant_transaction_id",
-            right_on="Transaction ID",
-            how="inner"
-        )
+        # Filter Order-list to the GMT+2 window and merge on transaction ID, keeping unmatched PSP entries
+        df_ord_filt = df_ord[(df_ord["Updated At"] >= start_ord) & (df_ord["Updated At"] <= end_ord)]
+        df_merged, unmatched_mask = merge_order_list(df_zen_filt, df_ord_filt, "merchant_transaction_id", "Transaction ID")
 
         # Check amount mismatches
-        mask_amt = df_merged["transaction_amount"] != df_merged["Grand Total"]
-        if mask_amt.any():
-            st.warning(f"Found {mask_amt.sum()} amount mismatches in ZEN:")
-            st.dataframe(df_merged.loc[mask_amt, [
-                "merchant_transaction_id", "transaction_amount", "Grand Total", "transaction_currency"
-            ]])
-        else:
-            st.success("No amount mismatches")
+        show_amount_mismatches(
+            df_merged, unmatched_mask, "transaction_amount",
+            ["merchant_transaction_id", "transaction_amount", "Grand Total", "transaction_currency"], "ZEN"
+        )
         
         # Handle unmatched PSP entries (add to CFD)
-        unmatched_zen_psp = df_zen_filt[~df_zen_filt["merchant_transaction_id"].isin(df_merged["merchant_transaction_id"])]
-        if len(unmatched_zen_psp) > 0:
-            st.warning(f"Found {len(unmatched_zen_psp)} unmatched ZEN PSP entries - adding to CFD:")
-            st.dataframe(unmatched_zen_psp[["merchant_transaction_id", "accepted_at", "transaction_amount", "transaction_currency"]])
-            # Add unmatched entries to CFD
-            unmatched_zen_psp = unmatched_zen_psp.copy()
-            unmatched_zen_psp["Plan Type"] = "CFD (Unmatched PSP)"
-            unmatched_zen_psp["Grand Total"] = unmatched_zen_psp["transaction_amount"]
-            df_merged = pd.concat([df_merged, unmatched_zen_psp], ignore_index=True)
-
+        book_unmatched_as_cfd(
+            df_merged, unmatched_mask, "transaction_amount",
+            ["merchant_transaction_id", "accepted_at", "transaction_amount", "transaction_currency"], "ZEN"
+        )
         st.info(f"Final total: {len(df_merged)} transactions included in export")
 
-        # Split into Futures vs CFD
-        df_futures = df_merged[df_merged["Plan Type"].apply(is_futures_plan)].copy()
-        df_cfd = df_merged[~df_merged["Plan Type"].apply(is_futures_plan)].copy()
-
-        # Sort by datetime before export
-        df_futures = df_futures.sort_values("accepted_at")
-        df_cfd = df_cfd.sort_values("accepted_at")
-
-        # Revenue summary (GMT+6 shift on accepted_at)
-        df_futures["Date"] = (df_futures["accepted_at"] + pd.Timedelta(hours=6)).dt.date
-        df_cfd["Date"] = (df_cfd["accepted_at"] + pd.Timedelta(hours=6)).dt.date
-        df_futures["Category"] = "Futures"
-        df_cfd["Category"] = "CFD"
-        df_summary = pd.concat([
-            df_cfd[["Date", "Category", "transaction_amount"]],
-            df_futures[["Date", "Category", "transaction_amount"]]
-        ])
-        df_summary = df_summary.groupby(["Date", "Category"], as_index=False).agg(Revenue=("transaction_amount", "sum")).sort_values("Date")
+        # Sort once by datetime; the Futures/CFD slices inherit the order for export
+        df_merged = df_merged.sort_values("accepted_at", kind="stable")
+
+        # Revenue summary (GMT+6 shift on accepted_at) and Futures vs CFD split
+        df_summary, df_futures, df_cfd = summarize_and_split(df_merged, "accepted_at", "transaction_amount")
 
         st.subheader("Datewise Revenue Summary (GMT+6)")
         st.dataframe(df_summary)
 
         # Excel output for ZEN
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            cols = df_zen.columns.tolist()
-            df_cfd[cols].to_excel(writer, sheet_name='CFD', index=False)
-            df_futures[cols].to_excel(writer, sheet_name='Futures', index=False)
-            df_summary.to_excel(writer, sheet_name='Revenue Summary', index=False)
-            for sheet_name, df_out in [('CFD', df_cfd), ('Futures', df_futures), ('Revenue Summary', df_summary)]:
-                ws = writer.sheets[sheet_name]
-                for idx, col in enumerate(df_out.columns):
-                    max_len = max(df_out[col].astype(str).map(len).max(), len(col)) + 2
-                    ws.set_column(idx, idx, max_len)
-
-        st.download_button(
-            label="Download ZEN Comparison Report",
-            data=output.getvalue(),
-            file_name="zen_order_comparison.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        cols = df_zen.columns.tolist()
+        offer_report_download({
+            'CFD': (df_cfd, cols),
+            'Futures': (df_futures, cols),
+            'Revenue Summary': df_summary
+        }, "Download ZEN Comparison Report", "zen_order_comparison.xlsx")
         
         # Store in session state for Summary tab
         st.session_state['zen_summary'] = df_summary.copy()
@@ -217,169 +510,97 @@ with tab_bp:
     order_files_bp = st.file_uploader("Upload Order-list Files for BridgerPay (Multiple files allowed)", key="order_files_bp", type=["csv", "xlsx"], accept_multiple_files=True)
 
     if bp_file and order_files_bp:
+        # Validate the Gateway over the whole file, since the CSV reader below drops non-approved rows before pandas sees them
+        require_gateway(uploaded_column_values(bp_file, "Gateway"), "Bridger Pay", "BridgerPay file must have Gateway='Bridger Pay'")
+
         # Load BridgerPay
-        if bp_file.name.lower().endswith('.csv'):
-            df_bp = pd.read_csv(bp_file)
-        else:
-            df_bp = pd.read_excel(bp_file)
+        # CSV uploads are pre-filtered to approved USD payments by the reader; the filter below still applies to Excel
+        df_bp = load_uploaded_file(bp_file, row_filter=(("status", "approved"), ("type", "payment"), ("currency", "USD")))
+        as_categories(df_bp, ("Gateway", "status", "type", "currency"))
         
         # Check if processing_date column exists and parse it
         if "processing_date" in df_bp.columns:
-            # Use format=None to auto-detect the format, and utc=True for timezone-aware parsing
-            df_bp["processing_date"] = pd.to_datetime(df_bp["processing_date"], format='mixed', utc=True)
-            # Remove timezone info to keep as naive datetime
-            df_bp["processing_date"] = df_bp["processing_date"].dt.tz_localize(None)
+            # Parse mixed formats straight to UTC and drop the zone in the same expression (UTC needs no DST lookup);
+            # values that can't be parsed become NaT and fall outside every date window
+            df_bp["processing_date"] = pd.to_datetime(df_bp["processing_date"], format='mixed', utc=True, errors="coerce").dt.tz_localize(None)
+            unparsed_bp = df_bp["processing_date"].isna().sum()
+            if unparsed_bp:
+                st.warning(f"Ignored {unparsed_bp} BridgerPay rows with a missing or unreadable processing_date")
         else:
             st.error(f"BridgerPay file must contain 'processing_date' column. Found columns: {list(df_bp.columns)}")
             st.stop()
+        require_columns(df_bp, ["merchantOrderId", "status", "type", "currency", "amount"], "BridgerPay")
 
-        # Validate and filter BridgerPay
-        if not (df_bp.get("Gateway", pd.Series()).eq("Bridger Pay").all()):
-            st.error("BridgerPay file must have Gateway='Bridger Pay'")
-            st.stop()
-
+        # Filter BridgerPay
         df_bp = df_bp[
-            (df_bp.get("status", "").str.lower() == "approved") &
-            (df_bp.get("type", "").str.lower() == "payment") &
-            (df_bp.get("currency", "").str.upper() == "USD")
+            category_matches(df_bp["status"], "approved") &
+            category_matches(df_bp["type"], "payment") &
+            category_matches(df_bp["currency"], "USD")
         ]
+        if df_bp["processing_date"].isna().all():
+            st.warning("No approved USD BridgerPay payments with a readable processing_date in this file")
+            st.stop()
 
         # Remove duplicates
-        initial_count = len(df_bp)
-        duplicates_bp = df_bp.duplicated(subset=["merchantOrderId"], keep=False)
-        if duplicates_bp.any():
-            st.warning(f"Removed {duplicates_bp.sum()} duplicates from {initial_count} BridgerPay transactions")
-            df_bp = df_bp.drop_duplicates(subset=["merchantOrderId"], keep="first")
+        df_bp = drop_duplicate_keys(df_bp, "merchantOrderId", "Removed {removed} duplicates from {initial} BridgerPay transactions")
         st.info(f"BridgerPay PSP: {len(df_bp)} clean transactions")
 
         # Date range selection based on BridgerPay processing_date
-        min_date_bp = df_bp['processing_date'].dt.date.min()
-        max_date_bp = df_bp['processing_date'].dt.date.max()
-        col1_bp, col2_bp = st.columns(2)
-        with col1_bp:
-            start_date_bp = st.date_input("Start date", value=min_date_bp, key="bp_start_date")
-        with col2_bp:
-            end_date_bp = st.date_input("End date", value=max_date_bp, key="bp_end_date")
+        start_date_bp, end_date_bp = select_date_range(df_bp["processing_date"], "bp")
         # Filter BridgerPay data for selected window (00:00 to 23:59:59)
         start_proc = datetime.combine(start_date_bp, time(0, 0, 0))
         end_proc   = datetime.combine(end_date_bp,   time(23, 59, 59))
-        df_bp = df_bp[(df_bp['processing_date'] >= start_proc) & (df_bp['processing_date'] <= end_proc)].copy()
+        df_bp = df_bp[(df_bp['processing_date'] >= start_proc) & (df_bp['processing_date'] <= end_proc)]
         
         # Define Order List window with GMT+2 offset
         start_ord_bp = datetime.combine(start_date_bp, time(2, 0, 0))
         end_ord_bp = datetime.combine(end_date_bp + timedelta(days=1), time(1, 59, 59))
 
         # Sort oldest→newest
-        df_bp = df_bp.sort_values("processing_date")
+        df_bp = df_bp.sort_values("processing_date", kind="stable")
 
         # Load and merge multiple Order-list files for BridgerPay
         st.subheader("Step 3: Process BridgerPay Order List Files")
         st.info(f"Processing {len(order_files_bp)} Order List file(s)")
+        df_ord2, ord2_stats = load_order_lists(order_files_bp, ORDER_LIST_COLUMNS, "Transaction ID")
+        require_gateway(ord2_stats["gateways"], "Bridger Pay", "Order-list must have Gateway='Bridger Pay'")
         
-        # Load all Order List files
-        order_list_dfs = []
-        for i, order_file in enumerate(order_files_bp):
-            if order_file.name.lower().endswith('.csv'):
-                df_temp = pd.read_csv(order_file, parse_dates=["Updated At"])
-            else:
-                df_temp = pd.read_excel(order_file, parse_dates=["Updated At"])
-            st.info(f"File {i+1} ({order_file.name}): {len(df_temp)} entries")
-            order_list_dfs.append(df_temp)
-        
-        # Merge all Order List files
-        df_ord2 = pd.concat(order_list_dfs, ignore_index=True)
-        st.info(f"Combined Order List: {len(df_ord2)} total entries before cleaning")
-        
-        if not all(g == "Bridger Pay" for g in df_ord2.get("Gateway", pd.Series()).unique()):
-            st.error("Order-list must have Gateway='Bridger Pay'")
-            st.stop()
-        df_ord2 = df_ord2[df_ord2.get("Gateway", "") == "Bridger Pay"].copy()
-        
-        # Clean merged Order List: Remove duplicates and sort by datetime
-        duplicates_ord = df_ord2.duplicated(subset=["Transaction ID"], keep=False)
-        if duplicates_ord.any():
-            st.warning(f"Removed {duplicates_ord.sum()} duplicates from merged Order List")
-            df_ord2 = df_ord2.drop_duplicates(subset=["Transaction ID"], keep="first")
-        
-        # Sort by Updated At datetime
-        df_ord2 = df_ord2.sort_values("Updated At")
-        
+        # Merged Order List was cleaned (duplicates removed, sorted by datetime) by the cached loader
+        if ord2_stats["removed"]:
+            st.warning(f"Removed {ord2_stats['removed']} duplicates from merged Order List")
         st.success(f"Final merged Order List: {len(df_ord2)} clean entries (sorted by datetime)")
         
         # Filter Order-list with GMT+2 offset window
-        df_ord2 = df_ord2[(df_ord2["Updated At"] >= start_ord_bp) & (df_ord2["Updated At"] <= end_ord_bp)].copy()
+        df_ord2 = df_ord2[(df_ord2["Updated At"] >= start_ord_bp) & (df_ord2["Updated At"] <= end_ord_bp)]
 
         # Merge and amount reconciliation for BP
-        df_ord2_sel = df_ord2[["Transaction ID", "Plan Type", "Grand Total"]].copy()
-        df_merged2 = df_bp.merge(
-            df_ord2_sel,
-            left_on="merchantOrderId",
-            right_on="Transaction ID",
-            how="inner"
+        df_merged2, unmatched_mask2 = merge_order_list(df_bp, df_ord2, "merchantOrderId", "Transaction ID")
+        show_amount_mismatches(
+            df_merged2, unmatched_mask2, "amount",
+            ["merchantOrderId", "amount", "Grand Total", "currency"], "BridgerPay"
         )
-        mask_amt2 = df_merged2["amount"] != df_merged2["Grand Total"]
-        if mask_amt2.any():
-            st.warning(f"Found {mask_amt2.sum()} amount mismatches in BridgerPay:")
-            st.dataframe(df_merged2.loc[mask_amt2, [
-                "merchantOrderId", "amount", "Grand Total", "currency"
-            ]])
-        else:
-            st.success("No amount mismatches")
         
         # Handle unmatched PSP entries (add to CFD)
-        unmatched_bp_psp = df_bp[~df_bp["merchantOrderId"].isin(df_merged2["merchantOrderId"])]
-        if len(unmatched_bp_psp) > 0:
-            st.warning(f"Found {len(unmatched_bp_psp)} unmatched BridgerPay PSP entries - adding to CFD:")
-            st.dataframe(unmatched_bp_psp[["merchantOrderId", "processing_date", "amount", "currency"]])
-            # Add unmatched entries to CFD
-            unmatched_bp_psp = unmatched_bp_psp.copy()
-            unmatched_bp_psp["Plan Type"] = "CFD (Unmatched PSP)"
-            unmatched_bp_psp["Grand Total"] = unmatched_bp_psp["amount"]
-            df_merged2 = pd.concat([df_merged2, unmatched_bp_psp], ignore_index=True)
-
+        book_unmatched_as_cfd(
+            df_merged2, unmatched_mask2, "amount",
+            ["merchantOrderId", "processing_date", "amount", "currency"], "BridgerPay"
+        )
         st.info(f"Final total: {len(df_merged2)} transactions included in export")
 
-        # Split into Futures vs CFD
-        df_futures2 = df_merged2[df_merged2["Plan Type"].apply(is_futures_plan)].copy()
-        df_cfd2 = df_merged2[~df_merged2["Plan Type"].apply(is_futures_plan)].copy()
-
-        # Sort by datetime before export
-        df_futures2 = df_futures2.sort_values("processing_date")
-        df_cfd2 = df_cfd2.sort_values("processing_date")
-
-        # Revenue summary (GMT+6 shift on processing_date)
-        df_futures2["Date"] = (df_futures2["processing_date"] + pd.Timedelta(hours=6)).dt.date
-        df_cfd2["Date"] = (df_cfd2["processing_date"] + pd.Timedelta(hours=6)).dt.date
-        df_futures2["Category"] = "Futures"
-        df_cfd2["Category"] = "CFD"
-        df_summary2 = pd.concat([
-            df_cfd2[["Date", "Category", "amount"]],
-            df_futures2[["Date", "Category", "amount"]]
-        ])
-        df_summary2 = df_summary2.groupby(["Date", "Category"], as_index=False).agg(Revenue=("amount", "sum")).sort_values("Date")
+        # Revenue summary (GMT+6 shift on processing_date) and Futures vs CFD split;
+        # the left merge keeps df_bp's datetime order, so the slices need no further sort
+        df_summary2, df_futures2, df_cfd2 = summarize_and_split(df_merged2, "processing_date", "amount")
 
         st.subheader("Datewise Revenue Summary (GMT+6)")
         st.dataframe(df_summary2)
 
         # Excel output for BP
-        output2 = io.BytesIO()
-        with pd.ExcelWriter(output2, engine="xlsxwriter") as writer:
-            cols_bp = df_bp.columns.tolist()
-            df_cfd2[cols_bp].to_excel(writer, sheet_name='CFD', index=False)
-            df_futures2[cols_bp].to_excel(writer, sheet_name='Futures', index=False)
-            df_summary2.to_excel(writer, sheet_name='Revenue Summary', index=False)
-            for sheet_name, df_out in [('CFD', df_cfd2), ('Futures', df_futures2), ('Revenue Summary', df_summary2)]:
-                ws = writer.sheets[sheet_name]
-                for idx, col in enumerate(df_out.columns):
-                    max_len = max(df_out[col].astype(str).map(len).max(), len(col)) + 2
-                    ws.set_column(idx, idx, max_len)
-
-        st.download_button(
-            label="Download BridgerPay Comparison Report",
-            data=output2.getvalue(),
-            file_name="bridgerpay_order_comparison.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        cols_bp = df_bp.columns.tolist()
+        offer_report_download({
+            'CFD': (df_cfd2, cols_bp),
+            'Futures': (df_futures2, cols_bp),
+            'Revenue Summary': df_summary2
+        }, "Download BridgerPay Comparison Report", "bridgerpay_order_comparison.xlsx")
         
         # Store in session state for Summary tab
         st.session_state['bp_summary'] = df_summary2.copy()
@@ -395,11 +616,7 @@ with tab_coins:
 
     if coins_file and order_files_coins:
         # Load Coins Buy
-        if coins_file.name.lower().endswith('.csv'):
-            df_coins = pd.read_csv(coins_file, parse_dates=["Created"])
-        else:
-            df_coins = pd.read_excel(coins_file, parse_dates=["Created"])
-        df_coins["Created"] = df_coins["Created"].dt.tz_localize(None)
+        df_coins = load_uploaded_file(coins_file, ["Created"])
 
         # Calculate actual amount as Amount * Rate
         if "Amount" not in df_coins.columns or "Rate" not in df_coins.columns:
@@ -413,53 +630,33 @@ with tab_coins:
             st.warning(f"Excluded {mask_high_amount.sum()} transactions > 2500:")
             excluded_transactions = df_coins[mask_high_amount][["Tracking ID", "Created", "Amount", "Rate", "calculated_amount"]]
             st.dataframe(excluded_transactions)
-            df_coins = df_coins[~mask_high_amount].copy()
+            df_coins = df_coins[~mask_high_amount]
 
         duplicates_coins = df_coins.duplicated(subset=["Tracking ID"], keep=False)
         if duplicates_coins.any():
             st.info(f"Keeping {duplicates_coins.sum()} PSP duplicates for revenue:")
-            duplicate_coins_data = df_coins[duplicates_coins].sort_values("Tracking ID")
-            st.dataframe(duplicate_coins_data[["Tracking ID", "Created", "Amount", "Rate", "calculated_amount"]])
+            # Only select and sort the duplicate rows when the user asks to see them
+            if st.checkbox("Show duplicates", key="coins_show_duplicates"):
+                duplicate_coins_data = df_coins.loc[duplicates_coins, ["Tracking ID", "Created", "Amount", "Rate", "calculated_amount"]]
+                st.dataframe(duplicate_coins_data.sort_values("Tracking ID"))
         st.info(f"Coins Buy PSP: {len(df_coins)} total transactions")
 
         # Date range selection based on Coins Buy Created date
-        min_date_coins = df_coins['Created'].dt.date.min()
-        max_date_coins = df_coins['Created'].dt.date.max()
-        col1_coins, col2_coins = st.columns(2)
-        with col1_coins:
-            start_date_coins = st.date_input("Start date", value=min_date_coins, key="coins_start_date")
-        with col2_coins:
-            end_date_coins = st.date_input("End date", value=max_date_coins, key="coins_end_date")
+        start_date_coins, end_date_coins = select_date_range(df_coins["Created"], "coins")
         
         # Filter Coins Buy data for selected window (00:00 to 23:59:59)
         start_created = datetime.combine(start_date_coins, time(0, 0, 0))
         end_created = datetime.combine(end_date_coins, time(23, 59, 59))
-        df_coins = df_coins[(df_coins['Created'] >= start_created) & (df_coins['Created'] <= end_created)].copy()
+        df_coins = df_coins[(df_coins['Created'] >= start_created) & (df_coins['Created'] <= end_created)]
         
         # Define Order List window with GMT+2 offset
         start_ord_coins = datetime.combine(start_date_coins, time(2, 0, 0))
         end_ord_coins = datetime.combine(end_date_coins + timedelta(days=1), time(1, 59, 59))
 
-        # Sort oldest→newest
-        df_coins = df_coins.sort_values("Created")
-
         # Load and merge multiple Order-list files for Coins Buy
         st.subheader("Step 3: Process Coins Buy Order List Files")
         st.info(f"Processing {len(order_files_coins)} Order List file(s)")
-        
-        # Load all Order List files
-        order_list_dfs = []
-        for i, order_file in enumerate(order_files_coins):
-            if order_file.name.lower().endswith('.csv'):
-                df_temp = pd.read_csv(order_file, parse_dates=["Updated At"])
-            else:
-                df_temp = pd.read_excel(order_file, parse_dates=["Updated At"])
-            st.info(f"File {i+1} ({order_file.name}): {len(df_temp)} entries")
-            order_list_dfs.append(df_temp)
-        
-        # Merge all Order List files
-        df_ord3 = pd.concat(order_list_dfs, ignore_index=True)
-        st.info(f"Combined Order List: {len(df_ord3)} total entries before cleaning")
+        df_ord3, _ = load_order_lists(order_files_coins, COINS_ORDER_LIST_COLUMNS)
         
         # Check if Tracking ID exists in both files
         if "Tracking ID" not in df_coins.columns:
@@ -469,33 +666,26 @@ with tab_coins:
             st.error("Order-list file must contain 'Tracking ID' column for matching.")
             st.stop()
 
-        # Clean merged Order List: Remove None entries, duplicates, and sort by datetime
-        initial_ord3_count = len(df_ord3)
-        
-        # Remove None/blank Tracking ID entries
-        mask_none_tracking = df_ord3["Tracking ID"].isna() | (df_ord3["Tracking ID"].astype(str).str.strip().isin(["", "None", "none"]))
+        # Clean merged Order List: Remove None entries and duplicates with one combined mask
+        mask_none_tracking = df_ord3["Tracking ID"].astype("string").str.fullmatch(r"\s*(?:None|none)?\s*", na=True)
+        # The first row of any real Tracking ID is never a None row, so duplicates can be flagged on the full list
+        mask_dup_tracking = ~mask_none_tracking & df_ord3["Tracking ID"].duplicated(keep="first")
         if mask_none_tracking.any():
             st.warning(f"Removed {mask_none_tracking.sum()} 'None' entries from merged Order List")
-            df_ord3 = df_ord3[~mask_none_tracking].copy()
-        
-        # Remove duplicates (keep first occurrence)
-        duplicates_ord3 = df_ord3.duplicated(subset=["Tracking ID"], keep=False)
-        if duplicates_ord3.any():
-            st.warning(f"Removed {duplicates_ord3.sum()} duplicates from merged Order List")
-            df_ord3 = df_ord3.drop_duplicates(subset=["Tracking ID"], keep="first")
+        if mask_dup_tracking.any():
+            st.warning(f"Removed {mask_dup_tracking.sum()} duplicates from merged Order List")
+        df_ord3 = df_ord3[~(mask_none_tracking | mask_dup_tracking)]
         
-        # Sort by Updated At datetime
-        df_ord3 = df_ord3.sort_values("Updated At")
-        
-        st.success(f"Final merged Order List: {len(df_ord3)} clean entries (sorted by datetime)")
+        st.success(f"Final merged Order List: {len(df_ord3)} clean entries")
 
-        # Filter Order-list with GMT+2 offset window
-        df_ord3 = df_ord3[(df_ord3["Updated At"] >= start_ord_coins) & (df_ord3["Updated At"] <= end_ord_coins)].copy()
+        # Filter Order-list with GMT+2 offset window, then sort only the rows that remain
+        df_ord3 = df_ord3[(df_ord3["Updated At"] >= start_ord_coins) & (df_ord3["Updated At"] <= end_ord_coins)]
+        df_ord3 = df_ord3.sort_values("Updated At")
 
         # Handle blank Tracking ID and match
         mask_blank_tracking = df_coins["Tracking ID"].isna() | (df_coins["Tracking ID"].astype(str).str.strip() == "")
-        df_blank_tracking = df_coins[mask_blank_tracking].copy()
-        df_coins_with_tracking = df_coins[~mask_blank_tracking].copy()
+        df_blank_tracking = df_coins[mask_blank_tracking]
+        df_coins_with_tracking = df_coins[~mask_blank_tracking]
         
         if len(df_blank_tracking) > 0:
             st.warning(f"Assigned {len(df_blank_tracking)} blank Tracking ID entries to CFD")
@@ -503,70 +693,36 @@ with tab_coins:
             df_blank_tracking["Grand Total"] = df_blank_tracking["calculated_amount"]
 
         # Match with Order List
-        df_ord3_sel = df_ord3[["Tracking ID", "Plan Type", "Grand Total"]].copy()
-        df_merged3 = df_coins_with_tracking.merge(df_ord3_sel, on="Tracking ID", how="inner")
+        df_merged3, unmatched_mask3 = merge_order_list(df_coins_with_tracking, df_ord3, "Tracking ID", "Tracking ID")
         
-        if len(df_blank_tracking) > 0:
-            df_merged3 = pd.concat([df_merged3, df_blank_tracking], ignore_index=True)
-        
-        initial_matched_count = len(df_merged3)
-        st.success(f"Initial matches: {initial_matched_count - len(df_blank_tracking)} with Order List + {len(df_blank_tracking)} CFD (blank)")
+        st.success(f"Initial matches: {(~unmatched_mask3).sum()} with Order List + {len(df_blank_tracking)} CFD (blank)")
         
         # Handle unmatched PSP entries (add to CFD)
-        unmatched_coins_psp = df_coins_with_tracking[~df_coins_with_tracking["Tracking ID"].isin(df_ord3["Tracking ID"])]
-        if len(unmatched_coins_psp) > 0:
-            st.warning(f"Found {len(unmatched_coins_psp)} unmatched Coins Buy PSP entries - adding to CFD:")
-            st.dataframe(unmatched_coins_psp[["Tracking ID", "Created", "calculated_amount"]])
-            # Add unmatched entries to CFD
-            unmatched_coins_psp = unmatched_coins_psp.copy()
-            unmatched_coins_psp["Plan Type"] = "CFD (Unmatched PSP)"
-            unmatched_coins_psp["Grand Total"] = unmatched_coins_psp["calculated_amount"]
-            df_merged3 = pd.concat([df_merged3, unmatched_coins_psp], ignore_index=True)
+        book_unmatched_as_cfd(df_merged3, unmatched_mask3, "calculated_amount", ["Tracking ID", "Created", "calculated_amount"], "Coins Buy")
+        
+        if len(df_blank_tracking) > 0:
+            df_merged3 = pd.concat([df_merged3, df_blank_tracking], ignore_index=True)
 
         st.info(f"Final total: {len(df_merged3)} transactions included in export")
 
         # Sort all entries by Created datetime
-        df_merged3 = df_merged3.sort_values("Created")
+        df_merged3 = df_merged3.sort_values("Created", kind="stable")
 
         # Amount reconciliation (no display needed for Coins Buy)
 
-        # Split into Futures vs CFD
-        df_futures3 = df_merged3[df_merged3["Plan Type"].apply(is_futures_plan)].copy()
-        df_cfd3 = df_merged3[~df_merged3["Plan Type"].apply(is_futures_plan)].copy()
-
-        # Revenue summary (GMT+6 shift on Created)
-        df_futures3["Date"] = (df_futures3["Created"] + pd.Timedelta(hours=6)).dt.date
-        df_cfd3["Date"] = (df_cfd3["Created"] + pd.Timedelta(hours=6)).dt.date
-        df_futures3["Category"] = "Futures"
-        df_cfd3["Category"] = "CFD"
-        df_summary3 = pd.concat([
-            df_cfd3[["Date", "Category", "calculated_amount"]],
-            df_futures3[["Date", "Category", "calculated_amount"]]
-        ])
-        df_summary3 = df_summary3.groupby(["Date", "Category"], as_index=False).agg(Revenue=("calculated_amount", "sum"))
+        # Revenue summary (GMT+6 shift on Created) and Futures vs CFD split
+        df_summary3, df_futures3, df_cfd3 = summarize_and_split(df_merged3, "Created", "calculated_amount")
 
         st.subheader("Datewise Revenue Summary (GMT+6)")
         st.dataframe(df_summary3)
 
         # Excel output for Coins Buy
-        output3 = io.BytesIO()
-        with pd.ExcelWriter(output3, engine="xlsxwriter") as writer:
-            cols_coins = df_coins.columns.tolist()
-            df_cfd3[cols_coins].to_excel(writer, sheet_name='CFD', index=False)
-            df_futures3[cols_coins].to_excel(writer, sheet_name='Futures', index=False)
-            df_summary3.to_excel(writer, sheet_name='Revenue Summary', index=False)
-            for sheet_name, df_out in [('CFD', df_cfd3), ('Futures', df_futures3), ('Revenue Summary', df_summary3)]:
-                ws = writer.sheets[sheet_name]
-                for idx, col in enumerate(df_out.columns):
-                    max_len = max(df_out[col].astype(str).map(len).max(), len(col)) + 2
-                    ws.set_column(idx, idx, max_len)
-
-        st.download_button(
-            label="Download Coins Buy Comparison Report",
-            data=output3.getvalue(),
-            file_name="coinsbuy_order_comparison.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        cols_coins = df_coins.columns.tolist()
+        offer_report_download({
+            'CFD': (df_cfd3, cols_coins),
+            'Futures': (df_futures3, cols_coins),
+            'Revenue Summary': df_summary3
+        }, "Download Coins Buy Comparison Report", "coinsbuy_order_comparison.xlsx")
         
         # Store in session state for Summary tab
         st.session_state['coins_summary'] = df_summary3.copy()
@@ -582,59 +738,50 @@ with tab_payprocc:
     if payprocc_file:
         # Load PayProcc file (simple like other tabs)
         st.subheader("Step 1: Load PayProcc File")
-        if payprocc_file.name.lower().endswith('.csv') or payprocc_file.name.lower().endswith('.txt'):
-            df_payprocc = pd.read_csv(payprocc_file)
-        else:
-            df_payprocc = pd.read_excel(payprocc_file)
+        # Transaction Date is parsed inside the cached loader, so reruns don't reparse it
+        df_payprocc = load_uploaded_file(payprocc_file, ["Transaction Date"])
         
-        # Parse Transaction Date
-        if "Transaction Date" in df_payprocc.columns:
-            df_payprocc["Transaction Date"] = pd.to_datetime(df_payprocc["Transaction Date"])
-        else:
+        if "Transaction Date" not in df_payprocc.columns:
             st.error(f"PayProcc file must contain 'Transaction Date' column. Found columns: {list(df_payprocc.columns)}")
             st.stop()
         
         st.success(f"Loaded {len(df_payprocc)} PayProcc transactions")
         
         # Validate required columns
-        required_cols = ["Payment Public ID", "Amount", "Exchange Rate", "Description", "Type", "Status"]
-        missing_cols = [col for col in required_cols if col not in df_payprocc.columns]
-        if missing_cols:
-            st.error(f"PayProcc file must contain these columns: {', '.join(missing_cols)}. Found columns: {list(df_payprocc.columns)}")
-            st.stop()
+        require_columns(df_payprocc, ["Payment Public ID", "Amount", "Exchange Rate", "Description", "Type", "Status"], "PayProcc")
         
         # Filter for Type = "sale" and Status = "success"
         initial_count_pp = len(df_payprocc)
+        df_payprocc = as_categories(df_payprocc, ["Type", "Status"])
         df_payprocc = df_payprocc[
-            (df_payprocc["Type"].str.lower() == "sale") & 
-            (df_payprocc["Status"].str.lower() == "success")
-        ].copy()
+            category_matches(df_payprocc["Type"], "sale") & 
+            category_matches(df_payprocc["Status"], "success")
+        ]
         st.info(f"Filtered {initial_count_pp} → {len(df_payprocc)} transactions (Type=sale, Status=success)")
+        # Text columns that get deduped and scanned move to Arrow-backed strings (pandas 3 reads them that way already)
+        for col in ("Payment Public ID", "Description"):
+            if df_payprocc[col].dtype == object:
+                df_payprocc[col] = df_payprocc[col].astype("string[pyarrow]")
         
         # Remove duplicates by Payment Public ID
         st.subheader("Step 2: Remove Duplicates")
-        initial_count_pp = len(df_payprocc)
-        duplicates_pp = df_payprocc.duplicated(subset=["Payment Public ID"], keep=False)
-        if duplicates_pp.any():
-            st.warning(f"Found {duplicates_pp.sum()} duplicate transactions (removed)")
-            df_payprocc = df_payprocc.drop_duplicates(subset=["Payment Public ID"], keep="first")
+        df_payprocc = drop_duplicate_keys(df_payprocc, "Payment Public ID", "Found {removed} duplicate transactions (removed)")
         st.info(f"PayProcc: {len(df_payprocc)} clean transactions after duplicate removal")
         
         # Date range selection
         st.subheader("Step 3: Select Date Range")
-        min_date_pp = df_payprocc['Transaction Date'].dt.date.min()
-        max_date_pp = df_payprocc['Transaction Date'].dt.date.max()
-        col1_pp, col2_pp = st.columns(2)
-        with col1_pp:
-            start_date_pp = st.date_input("Start date", value=min_date_pp, key="pp_start_date")
-        with col2_pp:
-            end_date_pp = st.date_input("End date", value=max_date_pp, key="pp_end_date")
+        start_date_pp, end_date_pp = select_date_range(df_payprocc["Transaction Date"], "pp")
         
         # Filter by date range (already in GMT+6, no offset needed)
         start_dt_pp = datetime.combine(start_date_pp, time(0, 0, 0))
         end_dt_pp = datetime.combine(end_date_pp, time(23, 59, 59))
-        df_payprocc = df_payprocc[(df_payprocc['Transaction Date'] >= start_dt_pp) & 
-                                   (df_payprocc['Transaction Date'] <= end_dt_pp)].copy()
+        # Sort by Transaction Date (ascending order) once, stably, so the range is one contiguous slice
+        # and both category slices below come out ordered; missing dates sort last and fall outside it
+        df_payprocc = df_payprocc.sort_values("Transaction Date", kind="stable")
+        ts_pp = df_payprocc["Transaction Date"].to_numpy(dtype="datetime64[ns]")
+        start_pos_pp = ts_pp.searchsorted(np.datetime64(start_dt_pp), side="left")
+        end_pos_pp = ts_pp.searchsorted(np.datetime64(end_dt_pp), side="right")
+        df_payprocc = df_payprocc.iloc[start_pos_pp:end_pos_pp]
         
         st.info(f"Filtered to {len(df_payprocc)} transactions in selected date range")
         
@@ -642,68 +789,58 @@ with tab_payprocc:
         st.subheader("Step 4: Calculate Final Amount")
         # If Exchange Rate is empty, use Amount directly (already in USD)
         # If Exchange Rate has value, calculate Amount / Exchange Rate
-        df_payprocc["Final Amount"] = df_payprocc.apply(
-            lambda row: row["Amount"] if pd.isna(row["Exchange Rate"]) or row["Exchange Rate"] == 0 
-            else row["Amount"] / row["Exchange Rate"], 
-            axis=1
-        )
+        # Cast both columns to float64 once; text that isn't a number becomes NaN instead of failing the division,
+        # and those rows are reported and left out of revenue rather than booked at an unconverted amount
+        unreadable_pp = np.zeros(len(df_payprocc), dtype=bool)
+        numeric_pp = {}
+        for col in ("Amount", "Exchange Rate"):
+            values = pd.to_numeric(df_payprocc[col], errors="coerce")
+            unreadable_col = (values.isna() & df_payprocc[col].notna()).to_numpy()
+            if unreadable_col.any():
+                st.warning(f"Found {unreadable_col.sum()} PayProcc rows with an unreadable {col} (left out of revenue)")
+            unreadable_pp |= unreadable_col
+            numeric_pp[col] = values.to_numpy(dtype=np.float64)
+        amount_pp, rate_pp = numeric_pp["Amount"], numeric_pp["Exchange Rate"]
+        no_rate_pp = np.isnan(rate_pp) | (rate_pp == 0)
+        # Divide by 1 where there is no rate so the skipped rows don't raise divide-by-zero warnings
+        final_amount_pp = np.where(no_rate_pp, amount_pp, amount_pp / np.where(no_rate_pp, 1.0, rate_pp))
+        df_payprocc["Final Amount"] = np.where(unreadable_pp, np.nan, final_amount_pp)
         st.success(f"Calculated Final Amount (USD conversion applied)")
         
         # Split into Futures and CFD based on Description
         st.subheader("Step 5: Split by Category")
         
         # Check if Description contains "futures" (case-insensitive)
-        df_payprocc["is_futures"] = df_payprocc["Description"].apply(
-            lambda x: "futures" in str(x).lower() if pd.notna(x) else False
+        df_payprocc["is_futures"] = is_futures_plan(df_payprocc["Description"])
+        # Day of each transaction (already GMT+6) as datetime64[D], once for both categories
+        df_payprocc["Date"] = df_payprocc["Transaction Date"].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+        # Category as a two-value categorical coded straight from is_futures, so the groupby compares codes
+        df_payprocc["Category"] = pd.Categorical.from_codes(
+            df_payprocc["is_futures"].to_numpy(dtype=np.int8), dtype=pd.CategoricalDtype(["CFD", "Futures"])
         )
         
-        df_futures_pp = df_payprocc[df_payprocc["is_futures"]].copy()
-        df_cfd_pp = df_payprocc[~df_payprocc["is_futures"]].copy()
+        df_futures_pp = df_payprocc[df_payprocc["is_futures"]]
+        df_cfd_pp = df_payprocc[~df_payprocc["is_futures"]]
         
         st.info(f"Futures: {len(df_futures_pp)} transactions | CFD: {len(df_cfd_pp)} transactions")
         
-        # Sort by Transaction Date (ascending order)
-        df_futures_pp = df_futures_pp.sort_values("Transaction Date")
-        df_cfd_pp = df_cfd_pp.sort_values("Transaction Date")
-        
-        # Revenue summary (already in GMT+6)
+        # Revenue summary (already in GMT+6), grouped on the unsplit frame
         st.subheader("Step 6: Revenue Summary (GMT+6)")
-        df_futures_pp["Date"] = df_futures_pp["Transaction Date"].dt.date
-        df_cfd_pp["Date"] = df_cfd_pp["Transaction Date"].dt.date
-        df_futures_pp["Category"] = "Futures"
-        df_cfd_pp["Category"] = "CFD"
-        
-        df_summary_pp = pd.concat([
-            df_cfd_pp[["Date", "Category", "Final Amount"]],
-            df_futures_pp[["Date", "Category", "Final Amount"]]
-        ])
-        df_summary_pp = df_summary_pp.groupby(["Date", "Category"], as_index=False).agg(Revenue=("Final Amount", "sum"))
+        df_summary_pp = df_payprocc.groupby(["Date", "Category"], as_index=False, observed=True).agg(Revenue=("Final Amount", "sum"))
+        df_summary_pp["Date"] = df_summary_pp["Date"].dt.date
+        # Plain strings again for the stored summary, matching the other gateways' summaries in the Summary tab
+        df_summary_pp["Category"] = df_summary_pp["Category"].astype(str)
         
         st.subheader("Datewise Revenue Summary")
         st.dataframe(df_summary_pp)
         
         # Excel output for PayProcc
         st.subheader("Step 7: Download Report")
-        output_pp = io.BytesIO()
-        with pd.ExcelWriter(output_pp, engine="xlsxwriter") as writer:
-            # Write sheets
-            df_cfd_pp.to_excel(writer, sheet_name='CFD', index=False)
-            df_futures_pp.to_excel(writer, sheet_name='Futures', index=False)
-            df_summary_pp.to_excel(writer, sheet_name='Revenue Summary', index=False)
-            
-            # Auto-adjust column widths
-            for sheet_name, df_out in [('CFD', df_cfd_pp), ('Futures', df_futures_pp), ('Revenue Summary', df_summary_pp)]:
-                ws = writer.sheets[sheet_name]
-                for idx, col in enumerate(df_out.columns):
-                    max_len = max(df_out[col].astype(str).map(len).max(), len(col)) + 2
-                    ws.set_column(idx, idx, max_len)
-
-        st.download_button(
-            label="Download PayProcc Revenue Report",
-            data=output_pp.getvalue(),
-            file_name="payprocc_revenue_report.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        offer_report_download({
+            'CFD': df_cfd_pp,
+            'Futures': df_futures_pp,
+            'Revenue Summary': df_summary_pp
+        }, "Download PayProcc Revenue Report", "payprocc_revenue_report.xlsx")
         
         # Store in session state for Summary tab
         st.session_state['payprocc_summary'] = df_summary_pp.copy()
@@ -737,36 +874,22 @@ with tab_summary:
         gateways_processed.append("PayProcc")
     
     if summaries:
-        # Combine all summaries
-        df_combined = pd.concat(summaries, ignore_index=True)
-        
-        # Group by Date, Category, and Gateway
-        df_combined_grouped = df_combined.groupby(["Date", "Category", "Gateway"], as_index=False).agg(Revenue=("Revenue", "sum"))
+        # Combine all summaries; cached, so reruns with unchanged gateway summaries skip the rebuild
+        df_combined_grouped, df_pivot, df_gateway_totals, df_category_totals = combine_gateway_summaries(summaries)
         
         st.success(f"Showing data from: {', '.join(gateways_processed)}")
         
         # Show combined summary
         st.subheader("Combined Revenue by Date and Category")
         
-        # Pivot table for better visualization
-        df_pivot = df_combined_grouped.pivot_table(
-            index='Date', 
-            columns=['Category', 'Gateway'], 
-            values='Revenue', 
-            fill_value=0,
-            aggfunc='sum'
-        ).reset_index()
-        
         st.dataframe(df_pivot, use_container_width=True)
         
         # Total by Gateway
         st.subheader("Total Revenue by Gateway")
-        df_gateway_totals = df_combined_grouped.groupby("Gateway", as_index=False).agg(Total=("Revenue", "sum"))
         st.dataframe(df_gateway_totals)
         
         # Total by Category
         st.subheader("Total Revenue by Category")
-        df_category_totals = df_combined_grouped.groupby("Category", as_index=False).agg(Total=("Revenue", "sum"))
         st.dataframe(df_category_totals)
         
         # Grand Total
@@ -774,18 +897,11 @@ with tab_summary:
         st.metric("Grand Total Revenue", f"${grand_total:,.2f}")
         
         # Download combined summary
-        output_summary = io.BytesIO()
-        with pd.ExcelWriter(output_summary, engine="xlsxwriter") as writer:
-            df_combined_grouped.to_excel(writer, sheet_name='Combined Summary', index=False)
-            df_gateway_totals.to_excel(writer, sheet_name='Gateway Totals', index=False)
-            df_category_totals.to_excel(writer, sheet_name='Category Totals', index=False)
-        
-        st.download_button(
-            label="Download Combined Summary Report",
-            data=output_summary.getvalue(),
-            file_name="combined_gateway_summary.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        offer_report_download({
+            'Combined Summary': df_combined_grouped,
+            'Gateway Totals': df_gateway_totals,
+            'Category Totals': df_category_totals
+        }, "Download Combined Summary Report", "combined_gateway_summary.xlsx")
     else:
         st.info("Please process at least one gateway (ZEN, BridgerPay, Coins Buy, or PayProcc) to see the combined summary.")
         st.write("**Instructions:**")